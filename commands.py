@@ -1,6 +1,5 @@
-import itertools
 from pathlib import Path, PurePath
-from typing import Union
+from typing import Dict, Union
 
 import numpy as np
 import pandas as pd
@@ -78,9 +77,7 @@ MB_TO_GB = 1.0 / 1024.0
 class QualityOfService:
     def __init__(self, snapshot: parse.Snapshot):
         df_qos = snapshot[parse.QOS]
-        tres_records = df_qos[MAX_TRES_PER_USER].apply(
-            lambda x: parse.parse_key_value_csl(x)
-        )
+        tres_records = df_qos[MAX_TRES_PER_USER].apply(parse.parse_key_value_csl)
 
         df_state = pd.DataFrame.from_records(data=tres_records)
         df_state["mem"] = df_state["mem"].apply(parse.parse_memory_value_to_gb)
@@ -124,8 +121,8 @@ class QualityOfService:
         self._df = merged_df
 
     def to_df(self, empty_value: str = ""):
-        df = self._df.copy()
-        df = df.replace(to_replace="", value=empty_value)
+        # replace() returns a new frame, so self._df is never modified
+        df = self._df.replace(to_replace="", value=empty_value)
         return df
 
     @staticmethod
@@ -177,11 +174,11 @@ class Nodes:
         df_state[REASON] = df_node[parse.REASON_N]
         df_state[PARTITIONS] = df_node[parse.PARTITIONS_N]
 
-        fields = itertools.product(RESOURCES, STATES)
-        for resource, state in fields:
-            field_name = self._to_field_name(resource, state)
-            series = self._extract_series(df=df_node, resource=resource, state=state)
-            df_state[field_name] = series
+        for resource in RESOURCES:
+            series = self._extract_series(df=df_node, resource=resource)
+            for state in STATES:
+                field_name = self._to_field_name(resource, state)
+                df_state[field_name] = series[state]
 
         self._df = df_state
 
@@ -197,60 +194,37 @@ class Nodes:
         return series.replace("", "0.0")
 
     @staticmethod
-    def _extract_series(df: pd.DataFrame, resource: str, state: str) -> pd.Series:
-        # TODO can we make this table-driven instead of spaghetti?
+    def _extract_series(df: pd.DataFrame, resource: str) -> Dict[str, pd.Series]:
+        """
+        Returns a dict mapping each state to its series for the given resource.
+        Inputs are parsed once per resource and shared by all states.
+        """
         if resource == CORE:
             hardware = df[parse.CPUTOT_N].astype(int)
             allocated = df[parse.CPUALLOC_N].astype(int)
             used = Nodes._str_to_float(series=df[parse.CPULOAD_N]).astype(float)
-            if state in (HARDWARE, POOL):
-                out = hardware
-            elif state == ALLOCATED:
-                out = allocated
-            elif state == IDLE:
-                out = hardware - allocated
-            elif state == USED:
-                out = used
-            else:
-                assert False
+            pool = hardware
         elif resource == MEMORY_GB:
             hardware = Nodes._normalize_mem(df[parse.REALMEMORY_MB_N])
             reserved = Nodes._normalize_mem(df[parse.MEMSPECLIMIT_MB_N])
             allocated = Nodes._normalize_mem(df[parse.ALLOCMEM_MB_N])
             free = Nodes._normalize_mem(df[parse.FREEMEM_MB_N])
-
             pool = hardware - reserved
-
-            if state == HARDWARE:
-                out = hardware
-            elif state == POOL:
-                out = pool
-            elif state == ALLOCATED:
-                out = allocated
-            elif state == IDLE:
-                out = pool - allocated
-            elif state == USED:
-                out = (
-                    pool - free
-                )  # TODO gives unexpected values, probably counts OS mem
-            else:
-                assert False
+            used = pool - free  # TODO gives unexpected values, probably counts OS mem
         elif resource == GPU:
             hardware = parse.parse_gpu_scontrol_node_all(df[parse.GRES_N])
             allocated = df[GPU_COUNT_ALLOCATED]
-            if state in (HARDWARE, POOL):
-                out = hardware
-            elif state == ALLOCATED:
-                out = allocated
-            elif state == IDLE:
-                out = hardware - allocated
-            elif state == USED:
-                out = allocated  # TODO see if we can do better
-            else:
-                assert False
+            pool = hardware
+            used = allocated  # TODO see if we can do better
         else:
             assert False
-        return out
+        return {
+            HARDWARE: hardware,
+            POOL: pool,
+            ALLOCATED: allocated,
+            IDLE: pool - allocated,
+            USED: used,
+        }
 
     @staticmethod
     def _merge_gpu_job_info(
@@ -437,5 +411,7 @@ class Load:
     @staticmethod
     def _to_pct_string(n: pd.Series, d: pd.Series) -> pd.Series:
         f = n / d
-        out = f.apply(func=lambda x: "{:.1%}".format(x))
+        # same text as "{:.1%}".format, which also scales by 100 before "f"
+        pct = np.char.mod("%.1f%%", f.to_numpy(dtype=float) * 100.0)
+        out = pd.Series(data=pct, index=f.index, dtype=object)
         return out
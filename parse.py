@@ -1,10 +1,9 @@
-import datetime as dt
-import multiprocessing as mp
+import concurrent.futures as cf
+import functools
 import re
 import subprocess
-from io import StringIO
 from pathlib import Path, PurePath
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import pandas as pd
 
@@ -21,8 +20,13 @@ JOB = "job"
 PARTITION = "partition"
 QOS = "qos"
 
+GPU_SCONTROL_NODE_REGEX = re.compile(r"(?:^|,)gpu:(?:[^,(]*:)?(\d+)(?=[(,]|$)")
+GPU_SCONTROL_NODE_FINDALL = GPU_SCONTROL_NODE_REGEX.findall
 GPU_SCONTROL_JOB_REGEX = re.compile(r"IDX:([0-9,-]+)")
-GPU_SCONTROL_NODE_REGEX = re.compile(r"gpu:.*?:([0-9]+)?")
+GPU_SCONTROL_JOB_FINDALL = GPU_SCONTROL_JOB_REGEX.findall
+
+CSL_ITEM_REGEX = re.compile(r"(\d+)(?:-(\d+))?")
+CSL_ITEM_FULLMATCH = CSL_ITEM_REGEX.fullmatch
 
 NAME_N = "NodeName"
 REASON_N = "Reason"
@@ -48,10 +52,27 @@ PRIORITYTIER_P = "PriorityTier"
 TOTALCPUS_P = "TotalCPUs"
 TOTALNODES_P = "TotalNodes"
 
+SCONTROL_PAIR_REGEX = re.compile(r"([^ =]*)=(.*?)(?= [^ =]*=|\Z)")
+SCONTROL_PAIR_FINDITER = SCONTROL_PAIR_REGEX.finditer
+
+# one group of a nodelist, a node name or a prefix with a bracketed csl
+NODELIST_GROUP_REGEX = re.compile(r"([^,\[\]]+)(?:\[([^\[\]]*)\])?")
+NODELIST_GROUP_MATCH = NODELIST_GROUP_REGEX.match
+
 DURATION_REGEX_STRING = (
     r"((?P<days>\d+)-)?((?P<hours>\d+))?:((?P<minutes>\d+))?:((?P<seconds>\d+))?"
 )
 DURATION_REGEX = re.compile(DURATION_REGEX_STRING)
+DURATION_MATCH = DURATION_REGEX.match
+DURATION_UNITS = ("days", "hours", "minutes", "seconds")
+DURATION_UNIT_SECONDS = (86400, 3600, 60, 1)
+
+MEMORY_GB_MULTIPLIERS = {
+    "k": 1024.0 ** -2,
+    "m": 1024.0 ** -1,
+    "g": 1.0,
+    "t": 1024.0,
+}
 
 
 SEP = "|"
@@ -93,10 +114,20 @@ def snapshot_command_output(command: str, flags: List[str]) -> str:
 
 def parse_pipe_separated(lines: List[str], sep: str = SEP) -> pd.DataFrame:
     """
-    Parses output of sacctmgr *.
+    Parses output of sacctmgr * -P. The first line is the header. Rows are split
+    directly rather than rejoined and handed to read_csv, but the result matches
+    what read_csv gave. Short rows are filled with missing values, long rows are
+    truncated to the header, and numeric columns get numeric dtypes.
     """
-    string = "\n".join(lines)
-    df = pd.read_csv(StringIO(string), sep=sep)
+    rows = [line.split(sep) for line in lines if line]
+    if not rows:
+        return pd.DataFrame()
+    header, *data = rows
+    width = len(header)
+    data = [(row + [None] * (width - len(row)))[:width] for row in data]
+    df = pd.DataFrame(data=data, columns=header)
+    df = df.mask(df == "")
+    df = df.apply(pd.to_numeric, errors="ignore")
     df = _fillna_extended(df=df)
     return df
 
@@ -113,22 +144,7 @@ def parse_scontrol(lines: List[str], sep: str = SEP) -> pd.DataFrame:
     The model is that each arg is composed of a field and a value as
     <field>=<value>. Values have spaces, but the field-value pairs are space
     separated and values can contain equals symbols, so we have to take care in
-    parsing.
-
-    The approach to parsing this involves parsing in reverse order. We loop over
-    the contents of a line, popping them from the back end and putting them in
-    both the field and value. When we hit an equals character, we reset the
-    field and change state (equals_hit=True). When we hit a space while
-    equals_hit=True, we assume we've just finished collecting the actual field,
-    so we turn the field and value into strings, remove the field and leading
-    `=` from the value string, and strip leading and trailing whitespace. Then
-    we add the results to a dict with field as key and value as value. We reset
-    state and continue parsing the line.
-
-    This method will not work for a value that has a space followed by an equals
-    sign. But then the problem becomes ill-posed because we can no longer
-    distinguish when a field-value pair ends, so we hope dearly that this never
-    happens. If it does we'll have to stop using the `-o` flag.
+    parsing. See parse_scontrol_line() for how each line is handled.
 
     The input sep is used to create a delimited string when a field appears
     multiple times. Notably this occurs for "Nodes" and "GRES_IDX" in `scontrol
@@ -136,60 +152,62 @@ def parse_scontrol(lines: List[str], sep: str = SEP) -> pd.DataFrame:
     """
     all_data: List[Dict[str, str]] = []
     for line_s in lines:
-        line_data: Dict[str, List[str]] = {}
-        line: List[str] = list(line_s)
-        field: List[str] = []
-        value: List[str] = []
-        equals_hit = False
-        while line:
-            c: str = line.pop()
-            field.append(c)
-            value.append(c)
-            if c == "=":
-                field = []
-                equals_hit = True
-            if (c == " " or not line) and equals_hit:
-                field_s: str = "".join(field[::-1])
-                field_s = field_s.strip()
-
-                value_s: str = "".join(value[::-1])
-                value_s = value_s.replace(field_s, "", 1)
-                value_s = value_s.replace("=", "", 1)
-                value_s = value_s.strip()
-
-                if field_s in line_data:
-                    line_data[field_s].append(value_s)
-                else:
-                    line_data[field_s] = [value_s]
-
-                field = []
-                value = []
-                equals_hit = False
-
-        line_data.pop("", None)
-        line_df_data: Dict[str, str] = {k: sep.join(v) for k, v in line_data.items()}
+        line_df_data = parse_scontrol_line(line=line_s, sep=sep)
         all_data.append(line_df_data)
-        # TODO deal with the case where multiple nodes are requested. Will get multiple of some columns!
+        # fields repeated on a line, like "Nodes" and "GRES_IDX" for jobs on
+        # multiple nodes, arrive here as one sep-joined value per field
 
     df = pd.DataFrame(all_data)
     df = _fillna_extended(df=df)
     return df
 
 
+def parse_scontrol_line(line: str, sep: str = SEP) -> Dict[str, str]:
+    """
+    Parses a single line of output of scontrol -o *. Returns a dict with fields
+    as keys.
+
+    A field is the run of non-space characters directly before an equals sign,
+    and its value runs until the next space that is followed by another field
+    and equals sign. Fields and values have surrounding whitespace stripped. A
+    single precompiled regex scan (SCONTROL_PAIR_REGEX) finds every pair, so
+    equals signs inside a value are kept as part of that value.
+
+    This method will not work for a value that has a space followed by an equals
+    sign. But then the problem becomes ill-posed because we can no longer
+    distinguish when a field-value pair ends, so we hope dearly that this never
+    happens. If it does we'll have to stop using the `-o` flag.
+
+    Fields that appear multiple times have their values joined with sep.
+    """
+    line_data: Dict[str, List[str]] = {}
+    for match in SCONTROL_PAIR_FINDITER(line):
+        field_s, value_s = match.groups()
+        field_s = field_s.strip()
+        value_s = value_s.strip()
+        line_data.setdefault(field_s, []).append(value_s)
+
+    line_data.pop("", None)
+    line_df_data: Dict[str, str] = {k: sep.join(v) for k, v in line_data.items()}
+    return line_df_data
+
+
+@functools.lru_cache(maxsize=1024)
 def parse_gpu_scontrol_node(gres_s: str) -> int:
     """
     Parses count of gpus from the `gres` field from `scontrol -o show node`. The
-    form is a comma separated list of `gpu:<name>:<count>`. Returns an integer.
+    form is a comma separated list of `gpu:<name>:<count>`, where each entry may
+    be followed by a socket list like `(S:0-1)`. Returns an integer.
+
+    A single scan with GPU_SCONTROL_NODE_REGEX finds the count of every gpu
+    entry. Socket lists may themselves contain commas, so we don't split first.
+    The regex can't backtrack across entries, as `[^,(]*` stops at the first
+    comma or socket list.
     """
-    gpus_total = 0
     if "(null)" in gres_s:
-        return gpus_total
-    gres_l = gres_s.split(",")
-    for gres in gres_l:
-        matches = re.findall(pattern=GPU_SCONTROL_NODE_REGEX, string=gres)
-        values = [int(m) for m in matches]
-        gpus_total += sum(values)
-    return gpus_total
+        return 0
+    counts = GPU_SCONTROL_NODE_FINDALL(gres_s)
+    return sum(int(c) for c in counts)
 
 
 def parse_gpu_scontrol_node_all(s: pd.Series) -> pd.Series:
@@ -198,21 +216,18 @@ def parse_gpu_scontrol_node_all(s: pd.Series) -> pd.Series:
     return out
 
 
+@functools.lru_cache(maxsize=1024)
 def parse_gpu_scontrol_job(gres_s: str) -> int:
     """
     Parses count of gpus from the `GRES_IDX` field from `scontrol -o show job`.
     The form is a comma separated list of `gpu(IDX:<csl of #>)`. Note the nested
-    comma separated list. Returns an integer.
+    comma separated list, so the whole field is scanned at once rather than split
+    on commas first. Returns an integer.
     """
-    gpus_total = 0
     if not isinstance(gres_s, str):
-        return gpus_total
-    gres_l = gres_s.split(",")
-    for gres in gres_l:
-        matches = re.findall(pattern=GPU_SCONTROL_JOB_REGEX, string=gres)
-        values = [len(_parse_csl(m)) for m in matches]
-        gpus_total += sum(values)
-    return gpus_total
+        return 0
+    matches = GPU_SCONTROL_JOB_FINDALL(gres_s)
+    return sum(_count_csl(m) for m in matches)
 
 
 def parse_delimited_gpu_scontrol_job(
@@ -229,42 +244,34 @@ def parse_delimited_gpu_scontrol_job(
     This function returns a dict whose keys are node names and values are gpu
     counts.
     """
-    all_nodes = []
-    all_gpus = []
+    if sep not in node_s:
+        # common case of a single nodelist, skip splitting and zipping
+        gres, _, _ = gres_s.partition(sep)
+        gpu_count = parse_gpu_scontrol_job(gres_s=gres)
+        return dict.fromkeys(_parse_nodelist(node_s), gpu_count)
+
+    out = {}
     nodelists = node_s.split(sep=sep)
     greslists = gres_s.split(sep=sep)
     for nodelist, gres in zip(nodelists, greslists):
         gpu_count = parse_gpu_scontrol_job(gres_s=gres)
-        if "[" in nodelist:  # csl-style range
-            nodes = _parse_nodelist(nodelist, sep=sep)
-            nodes = nodes.split(sep=sep)
-            gpus = [gpu_count] * len(nodes)
-        else:  # single
-            nodes = [nodelist]
-            gpus = [gpu_count]
-        all_nodes.extend(nodes)
-        all_gpus.extend(gpus)
-
-    out = {}
-    for n, g in zip(all_nodes, all_gpus):
-        out[n] = g
+        for node in _parse_nodelist(nodelist):
+            out[node] = gpu_count
     return out
 
 
 def parse_gpu_scontrol_job_all(
     node_s: pd.Series, gres_s: pd.Series, sep: str = SEP
 ) -> pd.DataFrame:
-    ds = []
+    all_gpus: Dict[str, int] = {}
     for n, g in zip(node_s, gres_s):
-        d = parse_delimited_gpu_scontrol_job(node_s=n, gres_s=g, sep=sep)
-        ds.append(d)
-
-    all_gpus = {}
-    for d in ds:
-        for n, g in d.items():
-            if n not in all_gpus:
-                all_gpus[n] = 0
-            all_gpus[n] += g
+        try:
+            d = parse_delimited_gpu_scontrol_job(node_s=n, gres_s=g, sep=sep)
+        except ValueError:
+            # one malformed nodelist skips only that job, not the whole table
+            continue
+        for node, gpus in d.items():
+            all_gpus[node] = all_gpus.get(node, 0) + gpus
 
     out = pd.DataFrame.from_dict(all_gpus, orient="index", columns=[GRES_IDX_J])
     out.index = out.index.set_names([NODES_J])
@@ -280,38 +287,27 @@ def available(df: pd.DataFrame) -> pd.Series:
     return out
 
 
+@functools.lru_cache(maxsize=1024)
 def duration_to_dh(duration: str) -> str:
-    d = DURATION_REGEX.match(duration)
-    if d is None:
+    seconds = _parse_duration(duration)
+    if seconds is None:
         out = "unknown duration"
     else:
-        units = ("days", "hours", "minutes", "seconds")
-        values = [d.group(k) for k in units]
-        parts_of_td = {k: float(x) for k, x in zip(units, values) if x is not None}
-        td = dt.timedelta(**parts_of_td)
-
-        days = td.days
-        seconds = td.seconds
-        hours, _ = divmod(seconds, 3600)
+        days, seconds = divmod(seconds, 86400)
+        hours = seconds // 3600
         out = f"{hours: >2d} hours"
         if 0 < days:
             out = f"{days: >d} days, " + out
     return out
 
 
+@functools.lru_cache(maxsize=1024)
 def duration_to_h(duration: str) -> str:
-    d = DURATION_REGEX.match(duration)
-    if d is None:
+    seconds = _parse_duration(duration)
+    if seconds is None:
         out = "unknown duration"
     else:
-        units = ("days", "hours", "minutes", "seconds")
-        values = [d.group(k) for k in units]
-        parts_of_td = {k: float(x) for k, x in zip(units, values) if x is not None}
-        td = dt.timedelta(**parts_of_td)
-
-        days = td.days
-        seconds = td.seconds + days * 86400
-        hours, _ = divmod(seconds, 3600)
+        hours = seconds // 3600
         out = f"{hours:d}"
 
     return out
@@ -330,21 +326,15 @@ def parse_key_value_csl(
     values = {}
     items = csl.split(item_sep)
     for item in items:
-        try:
-            parts = item.split(key_value_sep)
-            key = parts[0]
-            value = parts[1]
-        except:
+        key, found, value = item.partition(key_value_sep)
+        if not found:
             continue
+        value, _, _ = value.partition(key_value_sep)
 
         if key in values:
             continue
 
-        try:
-            value = int(value)
-        except:
-            pass
-
+        # any int also parses as float, so a single attempt covers both
         try:
             value = float(value)
         except:
@@ -355,17 +345,12 @@ def parse_key_value_csl(
     return values
 
 
+@functools.lru_cache(maxsize=1024)
 def parse_memory_value_to_gb(value: str) -> float:
     try:
         amount = float(value[:-1])
         unit = value[-1].casefold()
-        MULTIPLIERS = {
-            "k": 1024.0 ** -2,
-            "m": 1024.0 ** -1,
-            "g": 1.0,
-            "t": 1024.0,
-        }
-        amount *= MULTIPLIERS[unit]
+        amount *= MEMORY_GB_MULTIPLIERS[unit]
     except:
         amount = float("nan")
     return amount
@@ -385,47 +370,117 @@ def parse_memory_value_to_gb(value: str) -> float:
 #     return out
 
 
+def _parse_duration(duration: str) -> Optional[int]:
+    """
+    Shared decoding of Slurm durations like `1-02:03:04` for the duration_to_*
+    formatters. Returns the total as integer seconds, or None if the duration
+    doesn't match, e.g. `UNLIMITED`.
+    """
+    d = DURATION_MATCH(duration)
+    if d is None:
+        return None
+    values = d.group(*DURATION_UNITS)
+    return sum(
+        int(x) * s for x, s in zip(values, DURATION_UNIT_SECONDS) if x is not None
+    )
+
+
 def _parse_csl(csl: str) -> List[int]:
     """
     Utility to parse comma-separated lists of integers that can contain
-    hyphenated ranges. Returns an explicit list of integers.
+    hyphenated ranges. Returns an explicit list of integers. Reversed ranges
+    like `5-3` are expanded in ascending order. Items that aren't numbers or
+    ranges are skipped.
 
     NOTE: We could save memory by turning this into a generator. It would work
     by returning list values. When the list is empty we pop the next token.
     Tokens would be single values or a range, with its trailing comma (if there
     is one). We almost certainly won't need to do this.
     """
-    if csl == "":
-        return []
     values = []
-    ranges = csl.split(",")
-    for r in ranges:
-        try:
-            v = int(r)
-            values.append(v)
-        except:
-            extremes = [int(x) for x in r.split("-")]
-            max_v = max(extremes)
-            min_v = min(extremes)
-            v = list(range(min_v, max_v + 1))
-            values.extend(v)
+    for min_v, max_v in _iter_csl_ranges(csl):
+        values.extend(range(min_v, max_v + 1))
     return values
 
 
-def _parse_nodelist(nodelist: str, sep: str = SEP, digit_count: int = 4) -> str:
-    f = "{:0" + str(digit_count) + "d}"
-    n = nodelist.lstrip("c[")
-    n = n.rstrip("]")
-    ni = _parse_csl(csl=n)
-    ns = ["c" + f.format(x) for x in ni]
-    n = sep.join(ns)
-    return n
+def _count_csl(csl: str) -> int:
+    """
+    Counts the integers _parse_csl would return for `csl` without expanding any
+    ranges, so large ranges cost no more than small ones.
+    """
+    return sum(max_v - min_v + 1 for min_v, max_v in _iter_csl_ranges(csl))
+
+
+def _iter_csl_ranges(csl: str) -> Iterator[Tuple[int, int]]:
+    """
+    Yields each item of a comma-separated list as an inclusive (min, max) pair,
+    using the tokenization of _iter_csl_items().
+    """
+    for first, last in _iter_csl_items(csl):
+        if last is None:
+            v = int(first)
+            yield v, v
+        else:
+            min_v, max_v = sorted((int(first), int(last)))
+            yield min_v, max_v
+
+
+def _iter_csl_items(csl: str) -> Iterator[Tuple[str, Optional[str]]]:
+    """
+    Shared tokenization for all csl parsing. Yields the text of the first and
+    last number of each item of a comma-separated list, with last as None for a
+    single number. Every item must be entirely a number like `5` or a range like
+    `3-5`, anything else is skipped.
+    """
+    for item in csl.split(","):
+        match = CSL_ITEM_FULLMATCH(item)
+        if match is not None:
+            yield match.groups()
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_nodelist(nodelist: str) -> Tuple[str, ...]:
+    """
+    Expands a nodelist like `c[0001-0003,0007],d0001` into a tuple of node names.
+    Each comma separated group is either a single node, or a prefix followed by
+    a bracketed csl of node numbers, and is expanded separately. Node numbers
+    keep the zero padding they are written with, so `gpu[01-02]` gives `gpu01`
+    and `gpu02`. A nodelist that isn't made of such groups raises ValueError
+    rather than guessing at names.
+    """
+    if "," not in nodelist and "[" not in nodelist and "]" not in nodelist:
+        return (nodelist,)
+
+    nodes: List[str] = []
+    pos = 0
+    end = len(nodelist)
+    while True:
+        match = NODELIST_GROUP_MATCH(nodelist, pos)
+        if match is None:
+            raise ValueError("malformed nodelist: {!r}".format(nodelist))
+        prefix, csl = match.groups()
+        if csl is None:
+            nodes.append(prefix)
+        else:
+            for first, last in _iter_csl_items(csl):
+                width = len(first)
+                if last is None:
+                    last = first
+                min_v, max_v = sorted((int(first), int(last)))
+                numbers = range(min_v, max_v + 1)
+                nodes.extend(prefix + str(x).zfill(width) for x in numbers)
+        pos = match.end()
+        if pos == end:
+            break
+        if nodelist[pos] != ",":
+            raise ValueError("malformed nodelist: {!r}".format(nodelist))
+        pos += 1
+    return tuple(nodes)
 
 
 def _fillna_extended(df: pd.DataFrame) -> pd.DataFrame:
     df = df.fillna("")
-    df = df.replace("N/A", "")
-    df = df.replace("n/a", "")
+    df = df.replace(to_replace=["N/A", "n/a"], value="")
     return df
 
 
@@ -452,7 +507,7 @@ class Snapshot:
     def __init__(self, test_folder: Optional[PurePath] = None):
         self._test_folder = test_folder
         self._data = None
-        self._dataframes = None
+        self._dataframes: Dict[str, pd.DataFrame] = {}
 
     @property
     def sources(self) -> List[str]:
@@ -467,42 +522,38 @@ class Snapshot:
         self._test_folder = value
 
     def __getitem__(self, source: str) -> pd.DataFrame:
-        if self._dataframes is None:
-            self._parse_dataframes()
-        assert self._dataframes is not None
+        # parse lazily, commands rarely need every source
+        if source not in self._dataframes:
+            self._dataframes[source] = self._parse_dataframe(source=source)
         return self._dataframes[source]
 
     def take(self):
         """
         Takes a snapshot of scontrol -o show *sources.
         """
-        process_count = self._process_count
-        with mp.Pool(process_count) as pool:
+        # the work is waiting on subprocesses, so threads are enough
+        worker_count = self._worker_count
+        with cf.ThreadPoolExecutor(max_workers=worker_count) as executor:
             results = {}
             for source in self.sources:
-                results[source] = pool.apply_async(
-                    func=snapshot_command_output, kwds=self._SOURCES[source][ARGS],
+                results[source] = executor.submit(
+                    snapshot_command_output, **self._SOURCES[source][ARGS]
                 )
-            pool.close()
-            pool.join()
-        out = {k: r.get() for k, r in results.items()}
+        out = {k: r.result() for k, r in results.items()}
         self._data = out
+        self._dataframes = {}
 
     def has_test(self) -> bool:
         """
         Checks whether a complete test case exists.
         """
         assert self._test_folder is not None
-        exists = []
-        for source in self.sources:
-            filepath = self._build_test_path(source=source)
-            exists.append(Path(filepath).is_file())
-        if len(exists) == 0:
-            return False
-        elif all(exists):
-            return True
-        else:
+        sources = self.sources
+        if len(sources) == 0:
             return False
+        return all(
+            Path(self._build_test_path(source=source)).is_file() for source in sources
+        )
 
     def read_test(self):
         """
@@ -516,6 +567,7 @@ class Snapshot:
                 data = f.read()
             out[source] = data
         self._data = out
+        self._dataframes = {}
 
     def write_test(self):
         """
@@ -529,17 +581,16 @@ class Snapshot:
             with open(filepath, "w") as f:
                 f.write(data)
 
-    def _parse_dataframes(self) -> None:
+    def _parse_dataframe(self, source: str) -> pd.DataFrame:
         """
-        Converts to a dict of dataframes, one entry per source in self.sources.
+        Converts the snapshot of a single source to a dataframe.
         """
         assert self._data is not None
-        self._dataframes = {
-            k: self._SOURCES[k][PARSER](v.splitlines()) for k, v in self._data.items()
-        }
+        parser = self._SOURCES[source][PARSER]
+        return parser(self._data[source].splitlines())
 
     @property
-    def _process_count(self) -> int:
+    def _worker_count(self) -> int:
         return len(self.sources)
 
     def _build_test_path(self, source: str) -> PurePath:
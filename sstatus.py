@@ -1,5 +1,4 @@
 import argparse
-import multiprocessing as mp
 from pathlib import Path, PurePath
 from typing import Union
 
@@ -114,5 +113,4 @@ def _get_args() -> argparse.Namespace:
 
 
 if __name__ == "__main__":
-    mp.freeze_support()
     interface()
@@ -1,6 +1,7 @@
 import itertools
 from typing import Dict, Iterable, List, NamedTuple, Optional
 
+import numpy as np
 import pandas as pd
 
 CSV = "csv"
@@ -56,29 +57,48 @@ class AsciiTable:
         self._have_right_border = have_right_border
 
     @staticmethod
-    def get_column_widths(df: pd.DataFrame, precision: int) -> List[int]:
+    def get_column_widths(
+        df: pd.DataFrame, precision: int, formatted: bool = False
+    ) -> List[int]:
         """
-        skips index
+        skips index. Set formatted if df contents are already formatted as str, so
+        formatting is skipped.
         """
-        df = _format_df_contents_as_str(df=df, precision=precision)
+        if not formatted:
+            df = _format_df_contents_as_str(df=df, precision=precision)
+        return AsciiTable._compute_column_widths(df_str=df)
 
-        # get column-wise max string length
-        widths = []
-        for column in df.columns:
-            element_lengths = list(df[column].str.len())
-            element_lengths.append(len(column))  # include column headers
-            width = max(element_lengths)
-            widths.append(width)
-        return widths
+    @staticmethod
+    def _compute_column_widths(df_str: pd.DataFrame) -> List[int]:
+        """
+        Widths of a dataframe whose contents are already formatted as str.
+        """
+        # get column-wise max string length, including column headers
+        header_lengths = [len(column) for column in df_str.columns]
+        cells = df_str.to_numpy(dtype=object)
+        if cells.size == 0:
+            return header_lengths
+        lengths = np.fromiter(map(len, cells.ravel()), dtype=np.int64, count=cells.size)
+        lengths = lengths.reshape(cells.shape).max(axis=0)
+        widths = np.maximum(lengths, header_lengths)
+        return widths.tolist()
 
     def render(
         self,
         df: pd.DataFrame,
         user_alignments: Optional[Dict[str, str]] = None,
         default_alignment: str = LEFT_ALIGN,
+        formatted: bool = False,
     ) -> str:
-        df = _format_df_contents_as_str(df=df, precision=self._precision)
-        widths = self.get_column_widths(df, precision=self._precision)
+        """
+        Set formatted if df contents are already formatted as str, so formatting
+        is skipped.
+        """
+        if not formatted:
+            df = _format_df_contents_as_str(df=df, precision=self._precision)
+        widths = self.get_column_widths(
+            df=df, precision=self._precision, formatted=True
+        )
         alignments = _build_alignment_list(
             user_alignments=user_alignments,
             default_alignment=default_alignment,
@@ -86,42 +106,40 @@ class AsciiTable:
             format_map=self._ALIGNMENT_MAP,
         )
 
+        # both are fixed for the whole table, so build them once
+        row_template = self._build_row_template(alignments=alignments, widths=widths)
+        render_data_line = row_template.format
+        h_line = self._render_h_line(widths=widths)
+
         lines = []
         if self._have_top_border:
-            lines.append(self._render_h_line(widths=widths))
-        lines.append(
-            self._render_data_line(
-                alignments=alignments, widths=widths, data=list(df.columns)
-            )
-        )
+            lines.append(h_line)
+        lines.append(render_data_line(*df.columns))
         if self._have_header_separator:
-            lines.append(self._render_h_line(widths=widths))
-        for row in df.itertuples(index=False):
-            line = self._render_data_line(
-                alignments=alignments, widths=widths, data=list(row)
-            )
-            lines.append(line)
+            lines.append(h_line)
+        rows = df.itertuples(index=False, name=None)
+        lines.extend(itertools.starmap(render_data_line, rows))
         if self._have_bottom_border:
-            lines.append(self._render_h_line(widths=widths))
+            lines.append(h_line)
 
         out = "\n".join(lines)
         return out
 
-    def _render_data_line(
-        self, alignments: List[str], widths: List[int], data: List[str]
-    ) -> str:
-        # e.g. [{: >4s}, ...]
+    def _build_row_template(self, alignments: List[str], widths: List[int]) -> str:
+        """
+        Builds a single format string for a whole data line, e.g. `| {: >4s} |`
+        with one field per column. Alignments and widths are fixed for a table,
+        so this only needs to happen once per render.
+        """
+        v_el = _escape_format_literal(self._v_el)
+        padding = _escape_format_literal(self._generate_padding())
         formats = []
         for alignment, width in zip(alignments, widths):
             width_s = "{:d}".format(width)
             f = "{: " + alignment + width_s + "s}"
-            formats.append(f)
-        formatted_data = [f.format(d) for f, d in zip(formats, data)]
-        padded_data = [self._pad_cell(cell=d) for d in formatted_data]
-        line = self._fuse_cells_into_borderless_line(
-            element=self._v_el, cells=padded_data
-        )
-        line = self._add_lr_borders_to_line(element=self._v_el, line=line)
+            formats.append(padding + f + padding)
+        line = self._fuse_cells_into_borderless_line(element=v_el, cells=formats)
+        line = self._add_lr_borders_to_line(element=v_el, line=line)
         return line
 
     def _render_h_line(self, widths: List[int]) -> str:
@@ -145,9 +163,6 @@ class AsciiTable:
             line = line + element
         return line
 
-    def _pad_cell(self, cell: str) -> str:
-        return self._generate_padding() + cell + self._generate_padding()
-
     def _generate_padding(self) -> str:
         return self._p_amt * self._p_el
 
@@ -184,14 +199,19 @@ class MediaWikiTable:
             format_map=self._ALIGNMENT_MAP,
         )
 
-        lines = []
-        for row in df.itertuples(index=False):
-            lines.append(self._render_data_row(row=row, alignments=alignments))
-            lines.append(self._render_row_separator())
-        lines.pop()
-        lines.insert(0, self._render_table_metadata())
-        lines.insert(1, self._render_header_row(columns=df.columns))
-        lines.insert(2, self._render_row_separator())
+        # alignment is fixed per column, so cell prefixes are built only once
+        prefixes = [
+            self._make_cell_prefix(sep=self._VALUE_SEP, alignment=a) for a in alignments
+        ]
+
+        row_separator = self._render_row_separator()
+        lines = [
+            self._render_table_metadata(),
+            self._render_header_row(columns=df.columns),
+        ]
+        for row in df.itertuples(index=False, name=None):
+            lines.append(row_separator)
+            lines.append(self._render_data_row(row=row, prefixes=prefixes))
         lines.append(self._render_table_end())
         out = "\n".join(lines)
         return out
@@ -203,34 +223,28 @@ class MediaWikiTable:
         return self._POST
 
     def _render_header_row(self, columns: Iterable[str]) -> str:
-        alignments = itertools.repeat(None)
-        row = self._render_row(sep=self._HEADER_SEP, row=columns, alignments=alignments)
+        prefixes = itertools.repeat("")
+        row = self._render_row(sep=self._HEADER_SEP, row=columns, prefixes=prefixes)
         return row
 
-    def _render_data_row(self, row: Iterable[str], alignments: Iterable[str]) -> str:
-        row = self._render_row(sep=self._VALUE_SEP, row=row, alignments=alignments)
+    def _render_data_row(self, row: Iterable[str], prefixes: Iterable[str]) -> str:
+        row = self._render_row(sep=self._VALUE_SEP, row=row, prefixes=prefixes)
         return row
 
-    def _render_row(
-        self, sep: str, row: Iterable[str], alignments: Iterable[Optional[str]]
-    ) -> str:
-        row = [
-            self._make_cell(sep=sep, cell=c, alignment=a)
-            for c, a in zip(row, alignments)
-        ]
-        row = "".join(row)
-        row = row.rstrip(sep)  # trailing sep not used!
+    def _render_row(self, sep: str, row: Iterable[str], prefixes: Iterable[str]) -> str:
+        # cells are sep-separated and doubled between cells, e.g. `|a||b`
+        cells = (p + c for p, c in zip(prefixes, row))
+        row = sep + (sep + sep).join(cells)
         return row
 
     def _render_row_separator(self) -> str:
         return self._H_LINE
 
-    def _make_cell(self, sep: str, cell: str, alignment: Optional[str] = None) -> str:
-        cell = sep + cell + sep
-        if alignment is not None:
-            alignment_rep = 'align="{:s}"'.format(alignment)
-            cell = sep + alignment_rep + cell
-        return cell
+    def _make_cell_prefix(self, sep: str, alignment: Optional[str] = None) -> str:
+        if alignment is None:
+            return ""
+        alignment_rep = 'align="{:s}"'.format(alignment)
+        return alignment_rep + sep
 
 
 def apply_style(
@@ -240,35 +254,25 @@ def apply_style(
     default_alignment: str = LEFT_ALIGN,
     precision: int = 1,
 ) -> str:
-    if style == CSV:
-        out = as_csv(df=df)
-    elif style == MEDIAWIKI:
-        out = as_mediawiki(
-            df=df,
-            user_alignments=user_alignments,
-            default_alignment=default_alignment,
-            precision=precision,
-        )
-    elif style == MOTD:
-        out = as_motd(
-            df=df,
-            user_alignments=user_alignments,
-            default_alignment=default_alignment,
-            precision=precision,
+    if style not in _STYLE_FUNCS:
+        raise ValueError(
+            "unknown style {!r}, expected one of {:s}".format(style, ", ".join(STYLES))
         )
-    elif style == ASCII:
-        out = as_ascii_table(
-            df=df,
-            user_alignments=user_alignments,
-            default_alignment=default_alignment,
-            precision=precision,
-        )
-    else:
-        assert False
+    style_func = _STYLE_FUNCS[style]
+    out = style_func(
+        df=df,
+        user_alignments=user_alignments,
+        default_alignment=default_alignment,
+        precision=precision,
+    )
     return out
 
 
-def as_csv(df: pd.DataFrame) -> str:
+def as_csv(df: pd.DataFrame, **_) -> str:
+    """
+    Layout arguments, as passed by apply_style(), don't apply to csv and are
+    ignored.
+    """
     return df.to_csv(index=False)
 
 
@@ -316,8 +320,12 @@ def as_motd(
     Center align: `:----:`
     Right align:  `-----:`
     """
+    # format once up front, the strut row below would otherwise turn float columns
+    # into object columns and lose their precision
+    df = _format_df_contents_as_str(df=df, precision=precision)
+
     # inject alignment struts
-    widths = AsciiTable.get_column_widths(df=df, precision=precision)
+    widths = AsciiTable.get_column_widths(df=df, precision=precision, formatted=True)
     alignments = _build_alignment_list(
         user_alignments=user_alignments,
         default_alignment=default_alignment,
@@ -327,10 +335,9 @@ def as_motd(
         _render_motd_alignment_strut(width=w, alignment=a)
         for w, a in zip(widths, alignments)
     ]
-    # create an extra row for the struts and move it into place
-    df = df.append({c: "" for c in df.columns}, ignore_index=True)
-    df = df.shift()
-    df.iloc[0, :] = alignment_struts
+    # prepend an extra row for the struts
+    strut_row = pd.DataFrame(data=[alignment_struts], columns=df.columns)
+    df = pd.concat([strut_row, df], ignore_index=True)
 
     # build table
     ascii_table = AsciiTable(
@@ -345,7 +352,10 @@ def as_motd(
         have_bottom_border=False,
     )
     out = ascii_table.render(
-        df=df, user_alignments=user_alignments, default_alignment=default_alignment
+        df=df,
+        user_alignments=user_alignments,
+        default_alignment=default_alignment,
+        formatted=True,
     )
     out = out + "\n"
     return out
@@ -392,6 +402,14 @@ def as_ascii_table(
     return out
 
 
+_STYLE_FUNCS = {
+    CSV: as_csv,
+    MEDIAWIKI: as_mediawiki,
+    MOTD: as_motd,
+    ASCII: as_ascii_table,
+}
+
+
 def _render_motd_alignment_strut(width: int, alignment: str) -> str:
     """
     Builds OOD MOTD alignment struts like:
@@ -418,19 +436,48 @@ def _render_motd_alignment_strut(width: int, alignment: str) -> str:
     return strut
 
 
+def _escape_format_literal(s: str) -> str:
+    """
+    Escapes braces so s appears verbatim in a str.format template.
+    """
+    return s.replace("{", "{{").replace("}", "}}")
+
+
 def _format_df_contents_as_str(df: pd.DataFrame, precision: int) -> pd.DataFrame:
     """
-    Copies dataframe. Does not format index.
+    Returns a new dataframe, the input is not modified. Does not format index.
+    """
+    precision_fmt = "%." + "{:d}".format(precision) + "f"
+    float_columns = df.select_dtypes(include="floating").columns
+    object_columns = df.select_dtypes(include="object").columns
+    other_columns = df.columns.difference(
+        float_columns.append(object_columns), sort=False
+    )
+    # object columns holding only str, the common case, need no conversion
+    is_str = [_is_all_str(df[column]) for column in object_columns]
+    str_columns = object_columns[is_str]
+    object_columns = object_columns.difference(str_columns, sort=False)
+
+    formatted = {}
+    # one vectorized pass per column rather than a python call per cell
+    for column in float_columns:
+        formatted[column] = np.char.mod(precision_fmt, df[column].to_numpy())
+    formatted.update(df[str_columns].items())
+    # vectorized in pandas
+    formatted.update(df[object_columns].astype(str).items())
+    # for int and bool, apply(str) beats astype(str) in pandas
+    for column in other_columns:
+        formatted[column] = df[column].apply(str)
+    return pd.DataFrame(data=formatted, index=df.index, columns=df.columns)
+
+
+def _is_all_str(s: pd.Series) -> bool:
+    """
+    Checks whether every value is a str, using one full inference pass over the
+    column. A sample of the head can't prove the rest holds only str, and the
+    pass is still cheaper than building new str values with astype(str).
     """
-    df = df.copy()
-    precision_fmt = "{:." + "{:d}".format(precision) + "f}"
-    for column in df.columns:
-        d = df[column].dtype
-        if d == float:
-            df[column] = df[column].apply(lambda x: precision_fmt.format(x))
-        else:
-            df[column] = df[column].apply(str)
-    return df
+    return pd.api.types.infer_dtype(s, skipna=False) in ("string", "empty")
 
 
 def _build_alignment_list(
@@ -443,20 +490,13 @@ def _build_alignment_list(
     Builds formatted alignment strings from user selected alignments, one per
     column. If a user selected alignment exists, that is used. Otherwise the
     default is used. A format map may be supplied to transform raw user
-    alignments into a format appropriate for the style.
+    alignments into a format appropriate for the style. It must have a key for
+    each of ALIGNS, an unknown alignment raises KeyError.
     """
-    if format_map is not None:
-        assert set(format_map.keys()) == set(ALIGNS)
-
     if user_alignments is None:
         user_alignments = {}
 
-    alignments = []
-    for c in columns:
-        if c in user_alignments:
-            alignments.append(user_alignments[c])
-        else:
-            alignments.append(default_alignment)
+    alignments = [user_alignments.get(c, default_alignment) for c in columns]
     if format_map is not None:
         alignments = [format_map[a] for a in alignments]
     return alignments